@@ -2,6 +2,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
+from output_writer import read_report
 
 # Set style for better visualizations
 plt.style.use('default')  # Using default style instead of seaborn
@@ -148,8 +149,8 @@ def generate_summary_report(df, report_type='vehicle'):
 
 def main():
     # Load both datasets
-    vehicle_df = pd.read_csv('OUTPUT/yearly_mileage_by_vehicle_type_2023.csv')
-    fuel_df = pd.read_csv('OUTPUT/yearly_mileage_by_fuel_type_2023.csv')
+    vehicle_df = read_report('vehicle_type', 2023)
+    fuel_df = read_report('fuel_type', 2023)
     
     # Generate visualizations and reports for vehicle types
     plot_vehicle_counts(vehicle_df)
@@ -0,0 +1,273 @@
+# This module builds a vehicle_id-sorted, memory-mapped columnar store of MOT test history
+# It is filled as a byproduct of the processing pass in process_mileage_by_area.py
+# and gives fast point and range lookups by vehicle_id across all processed years
+#
+# Layout on disk (one directory per year under the index root):
+#   OUTPUT/mileage_history_index/
+#   ├── 2022/
+#   │   ├── vehicle_id.npy      # int64, sorted ascending
+#   │   ├── test_date.npy       # datetime64[D]
+#   │   ├── test_mileage.npy    # int32, -1 when missing
+#   │   ├── postcode_area.npy   # S4
+#   │   ├── test_class_id.npy   # int16, -1 when missing
+#   │   ├── fuel_type.npy       # S2
+#   │   ├── block_index.npy     # int64, first vehicle_id of every block
+#   │   └── meta.json
+#   └── 2023/
+#       └── ...
+
+import pandas as pd
+import numpy as np
+import json
+import os
+import shutil
+import sys
+
+INDEX_ROOT = 'OUTPUT/mileage_history_index'
+
+# Number of rows per block in the sparse block index
+BLOCK_SIZE = 4096
+
+# Number of buffered rows before they are spilled to disk as an (unsorted) run,
+# also the slice size used when gathering the sorted columns
+RUN_SIZE = 2_000_000
+
+# Column name -> on-disk dtype
+COLUMNS = {
+    'vehicle_id': np.int64,
+    'test_date': 'datetime64[D]',
+    'test_mileage': np.int32,
+    'postcode_area': 'S4',
+    'test_class_id': np.int16,
+    'fuel_type': 'S2',
+}
+
+
+def _chunk_to_arrays(chunk):
+    """Convert a chunk of test results into the on-disk column arrays"""
+    test_date = chunk['test_date']
+    if not pd.api.types.is_datetime64_any_dtype(test_date):
+        test_date = pd.to_datetime(test_date, errors='coerce')
+    vehicle_id = pd.to_numeric(chunk['vehicle_id'], errors='coerce')
+
+    # Only keep rows that can be placed in the history
+    valid = test_date.notna() & vehicle_id.notna()
+    test_date = test_date[valid]
+    vehicle_id = vehicle_id[valid]
+    chunk = chunk[valid]
+
+    mileage = pd.to_numeric(chunk['test_mileage'], errors='coerce').fillna(-1)
+    test_class = pd.to_numeric(chunk['test_class_id'], errors='coerce').fillna(-1)
+
+    return {
+        'vehicle_id': vehicle_id.to_numpy(dtype=np.int64),
+        'test_date': test_date.to_numpy(dtype='datetime64[D]'),
+        'test_mileage': mileage.to_numpy().astype(np.int32),
+        'postcode_area': chunk['postcode_area'].fillna('').astype(str).to_numpy().astype('S4'),
+        'test_class_id': test_class.to_numpy().astype(np.int16),
+        'fuel_type': chunk['fuel_type'].fillna('').astype(str).to_numpy().astype('S2'),
+    }
+
+
+class MileageHistoryIndexBuilder:
+    """Collect test rows chunk by chunk and write a sorted, memory-mapped store for one year"""
+
+    def __init__(self, year, index_root=INDEX_ROOT, block_size=BLOCK_SIZE, run_size=RUN_SIZE):
+        self.year = year
+        self.output_dir = os.path.join(index_root, str(year))
+        self.tmp_dir = self.output_dir + '.tmp'
+        self.block_size = block_size
+        self.run_size = run_size
+
+        self.buffer = {name: [] for name in COLUMNS}
+        self.buffered_rows = 0
+        self.run_lengths = []
+
+        # Start from a clean temporary directory
+        if os.path.exists(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+        os.makedirs(self.tmp_dir)
+
+    def add_chunk(self, chunk):
+        """Add a chunk of test results, test_date may already be converted to datetime"""
+        arrays = _chunk_to_arrays(chunk)
+        for name in COLUMNS:
+            self.buffer[name].append(arrays[name])
+        self.buffered_rows += len(arrays['vehicle_id'])
+
+        if self.buffered_rows >= self.run_size:
+            self._spill_run()
+
+    def _spill_run(self):
+        """Write the buffered rows to disk as one run"""
+        if self.buffered_rows == 0:
+            return
+        run_id = len(self.run_lengths)
+        for name in COLUMNS:
+            np.save(os.path.join(self.tmp_dir, f'run_{run_id}_{name}.npy'),
+                    np.concatenate(self.buffer[name]))
+        self.run_lengths.append(self.buffered_rows)
+        self.buffer = {name: [] for name in COLUMNS}
+        self.buffered_rows = 0
+
+    def finalize(self):
+        """Sort all rows by vehicle_id, write the columnar store and the block index
+
+        Peak memory is the vehicle_id and test_date columns plus the sort permutation
+        (about 24 bytes per row, roughly 1 GB for a 40M-row year). The other columns are
+        gathered from the memory-mapped run files in slices of run_size rows.
+        """
+        self._spill_run()
+        total_rows = sum(self.run_lengths)
+        runs = range(len(self.run_lengths))
+
+        # Sort on vehicle_id, then test_date so each vehicle's history is chronological
+        vehicle_ids = np.concatenate(
+            [np.load(self._run_path(i, 'vehicle_id')) for i in runs]
+        ) if total_rows else np.empty(0, dtype=np.int64)
+        test_dates = np.concatenate(
+            [np.load(self._run_path(i, 'test_date')) for i in runs]
+        ) if total_rows else np.empty(0, dtype='datetime64[D]')
+        order = np.lexsort((test_dates, vehicle_ids))
+        del test_dates
+
+        sorted_ids = vehicle_ids[order]
+        del vehicle_ids
+        np.save(os.path.join(self.tmp_dir, 'vehicle_id.npy'), sorted_ids)
+        np.save(os.path.join(self.tmp_dir, 'block_index.npy'), sorted_ids[::self.block_size].copy())
+        del sorted_ids
+
+        # First global row of every run, used to map sorted positions back to run files
+        run_starts = np.cumsum([0] + self.run_lengths[:-1])
+
+        # Gather the remaining columns one at a time into memory-mapped outputs
+        for name, dtype in COLUMNS.items():
+            if name == 'vehicle_id':
+                continue
+            run_columns = [np.load(self._run_path(i, name), mmap_mode='r') for i in runs]
+            out = np.lib.format.open_memmap(os.path.join(self.tmp_dir, f'{name}.npy'),
+                                            mode='w+', dtype=dtype, shape=(total_rows,))
+            for start in range(0, total_rows, self.run_size):
+                positions = order[start:start + self.run_size]
+                run_ids = np.searchsorted(run_starts, positions, side='right') - 1
+                values = np.empty(len(positions), dtype=dtype)
+                for run_id in np.unique(run_ids):
+                    in_run = run_ids == run_id
+                    values[in_run] = run_columns[run_id][positions[in_run] - run_starts[run_id]]
+                out[start:start + len(positions)] = values
+            out.flush()
+            del out, run_columns
+
+        for run_id in range(len(self.run_lengths)):
+            for name in COLUMNS:
+                os.remove(self._run_path(run_id, name))
+
+        with open(os.path.join(self.tmp_dir, 'meta.json'), 'w') as f:
+            json.dump({'year': self.year, 'rows': total_rows, 'block_size': self.block_size}, f)
+
+        # Swap the finished store into place
+        if os.path.exists(self.output_dir):
+            shutil.rmtree(self.output_dir)
+        os.replace(self.tmp_dir, self.output_dir)
+
+        print(f"Mileage history index for {self.year} saved to {self.output_dir} ({total_rows:,} rows)")
+
+    def discard(self):
+        """Drop the spilled rows without touching the existing store, e.g. after a partial run"""
+        if os.path.exists(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+        self.buffer = {name: [] for name in COLUMNS}
+        self.buffered_rows = 0
+        self.run_lengths = []
+
+    def _run_path(self, run_id, name):
+        return os.path.join(self.tmp_dir, f'run_{run_id}_{name}.npy')
+
+
+class MileageHistoryStore:
+    """Read-only view of one year of the history index, memory-mapped from disk"""
+
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.block_size = self.meta['block_size']
+        # The block index is small enough to keep in RAM
+        self.block_index = np.load(os.path.join(store_dir, 'block_index.npy'))
+        self.columns = {
+            name: np.load(os.path.join(store_dir, f'{name}.npy'), mmap_mode='r') for name in COLUMNS
+        }
+
+    def _position(self, vehicle_id, side):
+        """Find the row position of vehicle_id using the block index, then one block of the store"""
+        block = np.searchsorted(self.block_index, vehicle_id, side=side) - 1
+        if block < 0:
+            return 0
+        start = block * self.block_size
+        stop = min(start + self.block_size + 1, self.meta['rows'])
+        return start + int(np.searchsorted(self.columns['vehicle_id'][start:stop], vehicle_id, side=side))
+
+    def range(self, min_vehicle_id, max_vehicle_id):
+        """Return the rows with min_vehicle_id <= vehicle_id <= max_vehicle_id as a DataFrame"""
+        start = self._position(min_vehicle_id, 'left')
+        stop = self._position(max_vehicle_id, 'right')
+        return pd.DataFrame({name: np.asarray(column[start:stop]) for name, column in self.columns.items()})
+
+    def lookup(self, vehicle_id):
+        """Return all tests for a single vehicle as a DataFrame"""
+        return self.range(vehicle_id, vehicle_id)
+
+
+def open_stores(index_root=INDEX_ROOT):
+    """Open every year store found under the index root, keyed by year"""
+    stores = {}
+    if not os.path.isdir(index_root):
+        return stores
+    for name in sorted(os.listdir(index_root)):
+        store_dir = os.path.join(index_root, name)
+        # Skip stores left half-built by an interrupted run
+        if name.endswith('.tmp'):
+            continue
+        if os.path.isfile(os.path.join(store_dir, 'meta.json')):
+            stores[name] = MileageHistoryStore(store_dir)
+    return stores
+
+
+def _decode(df):
+    """Turn the fixed-width byte columns back into strings"""
+    for name in ['postcode_area', 'fuel_type']:
+        df[name] = df[name].str.decode('utf-8')
+    return df
+
+
+def vehicle_history(vehicle_id, index_root=INDEX_ROOT, stores=None):
+    """Return the test history of a vehicle across all indexed years"""
+    if stores is None:
+        stores = open_stores(index_root)
+    frames = [store.lookup(vehicle_id) for store in stores.values()]
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=list(COLUMNS))
+    history = pd.concat(frames, ignore_index=True).sort_values('test_date', ignore_index=True)
+    return _decode(history)
+
+
+def vehicle_range_history(min_vehicle_id, max_vehicle_id, index_root=INDEX_ROOT, stores=None):
+    """Return the test history of all vehicles in a vehicle_id range across all indexed years"""
+    if stores is None:
+        stores = open_stores(index_root)
+    frames = [store.range(min_vehicle_id, max_vehicle_id) for store in stores.values()]
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=list(COLUMNS))
+    history = pd.concat(frames, ignore_index=True).sort_values(['vehicle_id', 'test_date'], ignore_index=True)
+    return _decode(history)
+
+
+if __name__ == "__main__":
+    # Usage: python mileage_history_index.py <vehicle_id> [<max_vehicle_id>]
+    if len(sys.argv) == 2:
+        print(vehicle_history(int(sys.argv[1])).to_string())
+    elif len(sys.argv) == 3:
+        print(vehicle_range_history(int(sys.argv[1]), int(sys.argv[2])).to_string())
+    else:
+        print("Usage: python mileage_history_index.py <vehicle_id> [<max_vehicle_id>]")
@@ -0,0 +1,201 @@
+# This module maintains monthly rollups of yearly mileage, keyed on the month of test_date
+# Each rollup row holds mergeable partial aggregates for one
+# (month, postcode_area, vehicle_type, fuel_type) combination, where vehicle_type is the test_class_id
+# Quarterly, yearly and rolling-window views are derived from the rollups without rescanning the raw CSVs
+#
+# Layout on disk (one partition per month, one file per input file that has tests in that month):
+#   OUTPUT/monthly_rollups/
+#   ├── month=2023-01/
+#   │   ├── test_result_2023.parquet
+#   │   └── test_result_2024_01.parquet
+#   ├── month=2023-02/test_result_2023.parquet
+#   └── ...
+#
+# Reprocessing an input file replaces only that file's contribution, so updates are idempotent
+# and new monthly data is merged with what is already rolled up when the views are read
+
+import pandas as pd
+import numpy as np
+import os
+from output_writer import write_parquet_atomic
+
+ROLLUP_ROOT = 'OUTPUT/monthly_rollups'
+
+KEY_COLUMNS = ['postcode_area', 'vehicle_type', 'fuel_type']
+
+# Partial aggregate column -> how it is merged
+AGGREGATES = {
+    'vehicle_count': 'sum',
+    'total_mileage': 'sum',
+    'total_mileage_squared': 'sum',
+    'min_yearly_mileage': 'min',
+    'max_yearly_mileage': 'max',
+}
+
+
+def _merge(df, group_by):
+    """Merge partial aggregates over the given group columns"""
+    return df.groupby(group_by, dropna=False, observed=True).agg(AGGREGATES).reset_index()
+
+
+def _add_statistics(df):
+    """Derive average and standard deviation from the merged partial aggregates
+
+    std_yearly_mileage is the population standard deviation (ddof=0), unlike the
+    sample standard deviation (ddof=1) returned by pandas .std().
+    """
+    df['average_yearly_mileage'] = df['total_mileage'] / df['vehicle_count']
+    variance = df['total_mileage_squared'] / df['vehicle_count'] - df['average_yearly_mileage'] ** 2
+    df['std_yearly_mileage'] = np.sqrt(variance.clip(lower=0))
+    return df
+
+
+class MonthlyRollupBuilder:
+    """Accumulate monthly partial aggregates chunk by chunk and write the affected months"""
+
+    def __init__(self, source, rollup_root=ROLLUP_ROOT):
+        # Name of the input file the chunks come from, e.g. 'test_result_2023'
+        self.source = source
+        self.rollup_root = rollup_root
+        self.partials = []
+
+    def add_chunk(self, chunk):
+        """Add a processed chunk with test_date and yearly_mileage columns"""
+        valid = (np.isfinite(chunk['yearly_mileage']) &
+                 (chunk['yearly_mileage'] >= 0) & (chunk['yearly_mileage'] <= 100000))
+        chunk = chunk[valid]
+        if chunk.empty:
+            return
+
+        partial = pd.DataFrame({
+            'month': chunk['test_date'].dt.strftime('%Y-%m'),
+            'postcode_area': chunk['postcode_area'],
+            'vehicle_type': chunk['test_class_id'],
+            'fuel_type': chunk['fuel_type'],
+            'vehicle_count': 1,
+            'total_mileage': chunk['yearly_mileage'],
+            'total_mileage_squared': chunk['yearly_mileage'] ** 2,
+            'min_yearly_mileage': chunk['yearly_mileage'],
+            'max_yearly_mileage': chunk['yearly_mileage'],
+        })
+        self.partials.append(_merge(partial, ['month'] + KEY_COLUMNS))
+
+        # Keep the in-memory partials compact
+        if len(self.partials) >= 100:
+            self.partials = [_merge(pd.concat(self.partials, ignore_index=True), ['month'] + KEY_COLUMNS)]
+
+    def finalize(self):
+        """Write this source's rollups for every month seen in this pass
+
+        Files written by an earlier run of the same source are replaced, and removed from
+        months that no longer have any of its tests. Returns the list of months written.
+        """
+        file_name = f'{self.source}.parquet'
+        months = []
+        if self.partials:
+            rollups = _merge(pd.concat(self.partials, ignore_index=True), ['month'] + KEY_COLUMNS)
+            months = sorted(rollups['month'].unique())
+            for month in months:
+                month_rollups = rollups[rollups['month'] == month].drop(columns='month')
+                write_parquet_atomic(month_rollups, os.path.join(self.rollup_root, f'month={month}', file_name))
+
+        # Drop stale contributions of this source from other months
+        for month in set(list_months(self.rollup_root)) - set(months):
+            stale_path = os.path.join(self.rollup_root, f'month={month}', file_name)
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+                # Don't leave empty month directories behind
+                month_dir = os.path.dirname(stale_path)
+                if not os.listdir(month_dir):
+                    os.rmdir(month_dir)
+
+        if months:
+            print(f"Monthly rollups from {self.source} updated for {len(months)} months "
+                  f"({months[0]} to {months[-1]}) in {self.rollup_root}")
+        self.partials = []
+        return months
+
+
+def _source_files(month_dir):
+    """Return the rollup files in a month directory, skipping leftover temporary files"""
+    return sorted(name for name in os.listdir(month_dir) if name.endswith('.parquet') and not name.startswith('.'))
+
+
+def list_months(rollup_root=ROLLUP_ROOT):
+    """Return the months that have rollup data in the store"""
+    if not os.path.isdir(rollup_root):
+        return []
+    return sorted(name.split('=', 1)[1] for name in os.listdir(rollup_root)
+                  if name.startswith('month=') and _source_files(os.path.join(rollup_root, name)))
+
+
+def load_rollups(start_month=None, end_month=None, rollup_root=ROLLUP_ROOT):
+    """Read the monthly rollups between start_month and end_month (inclusive, 'YYYY-MM')"""
+    frames = []
+    for month in list_months(rollup_root):
+        if (start_month and month < start_month) or (end_month and month > end_month):
+            continue
+        month_dir = os.path.join(rollup_root, f'month={month}')
+        for name in _source_files(month_dir):
+            df = pd.read_parquet(os.path.join(month_dir, name))
+            df.insert(0, 'month', month)
+            frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=['month'] + KEY_COLUMNS + list(AGGREGATES))
+    # Merge the contributions of all sources
+    return _merge(pd.concat(frames, ignore_index=True), ['month'] + KEY_COLUMNS)
+
+
+def _period_view(freq, group_by, start_month, end_month, rollup_root):
+    """Merge monthly rollups into periods of the given frequency"""
+    group_by = list(group_by)
+    rollups = load_rollups(start_month, end_month, rollup_root)
+    rollups['period'] = pd.PeriodIndex(rollups['month'], freq='M').asfreq(freq).astype(str)
+    return _add_statistics(_merge(rollups, ['period'] + group_by))
+
+
+def monthly_view(group_by=('postcode_area',), start_month=None, end_month=None, rollup_root=ROLLUP_ROOT):
+    """Mileage statistics per month"""
+    return _period_view('M', group_by, start_month, end_month, rollup_root)
+
+
+def quarterly_view(group_by=('postcode_area',), start_month=None, end_month=None, rollup_root=ROLLUP_ROOT):
+    """Mileage statistics per quarter"""
+    return _period_view('Q', group_by, start_month, end_month, rollup_root)
+
+
+def yearly_view(group_by=('postcode_area',), start_month=None, end_month=None, rollup_root=ROLLUP_ROOT):
+    """Mileage statistics per year"""
+    return _period_view('Y', group_by, start_month, end_month, rollup_root)
+
+
+def rolling_view(window, group_by=('postcode_area',), start_month=None, end_month=None, rollup_root=ROLLUP_ROOT):
+    """Mileage statistics over a rolling window of months, labelled by the last month of the window"""
+    group_by = list(group_by)
+    monthly = _merge(load_rollups(start_month, end_month, rollup_root), ['month'] + group_by)
+    if monthly.empty:
+        return _add_statistics(monthly.rename(columns={'month': 'period'}))
+
+    all_months = pd.period_range(monthly['month'].min(), monthly['month'].max(), freq='M').astype(str)
+    groups = monthly.groupby(group_by, dropna=False) if group_by else [((), monthly)]
+
+    frames = []
+    for key, group in groups:
+        # Months without tests contribute nothing to the window
+        group = group.set_index('month').reindex(all_months)
+        rolled = pd.DataFrame({'period': all_months})
+        for column, how in AGGREGATES.items():
+            window_values = group[column].rolling(window, min_periods=1)
+            rolled[column] = (window_values.sum() if how == 'sum' else
+                              window_values.min() if how == 'min' else window_values.max()).to_numpy()
+        # Only keep complete windows that contain at least one test
+        rolled = rolled.iloc[window - 1:]
+        rolled = rolled[rolled['vehicle_count'] > 0]
+        for column, value in zip(group_by, key):
+            rolled[column] = value
+        frames.append(rolled)
+
+    rolled = pd.concat(frames, ignore_index=True)[['period'] + group_by + list(AGGREGATES)]
+    # Reindexing over missing months made the count a float
+    rolled['vehicle_count'] = rolled['vehicle_count'].astype(np.int64)
+    return _add_statistics(rolled)
@@ -0,0 +1,119 @@
+# This module writes the yearly mileage reports produced by process_mileage_by_area.py
+# Every report is written as a CSV file (as before) and as a Parquet dataset partitioned by year
+# All files are written to a temporary file first and renamed into place, so a run that dies
+# never leaves a half-written output behind
+#
+# Layout of the Parquet datasets:
+#   OUTPUT/yearly_mileage_parquet/
+#   ├── area/year=2023/part-0.parquet
+#   ├── vehicle_type/year=2023/part-0.parquet
+#   └── fuel_type/year=2023/part-0.parquet
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import os
+
+PARQUET_ROOT = 'OUTPUT/yearly_mileage_parquet'
+
+# Grouping -> CSV report name (without year)
+CSV_REPORTS = {
+    'area': 'OUTPUT/yearly_mileage_{year}.csv',
+    'vehicle_type': 'OUTPUT/yearly_mileage_by_vehicle_type_{year}.csv',
+    'fuel_type': 'OUTPUT/yearly_mileage_by_fuel_type_{year}.csv',
+}
+
+# Low-cardinality columns stored with dictionary encoding
+DICTIONARY_COLUMNS = ['postcode_area', 'vehicle_type', 'fuel_type']
+
+
+def _replace_atomically(tmp_path, path):
+    """Move a finished temporary file into place, removing it if anything went wrong"""
+    try:
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_csv_atomic(df, path):
+    """Write a DataFrame to CSV via a temporary file plus rename"""
+    tmp_path = f'{path}.tmp'
+    try:
+        df.to_csv(tmp_path, index=False)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _replace_atomically(tmp_path, path)
+
+
+def write_parquet_atomic(df, path):
+    """Write a DataFrame to a Parquet file via a temporary file plus rename"""
+    directory, name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    # A leading dot keeps a leftover temp file out of pyarrow's dataset discovery
+    tmp_path = os.path.join(directory, f'.{name}.tmp')
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    try:
+        pq.write_table(table, tmp_path,
+                       use_dictionary=[c for c in DICTIONARY_COLUMNS if c in df.columns],
+                       write_statistics=True,
+                       compression='snappy')
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _replace_atomically(tmp_path, path)
+    return path
+
+
+def write_parquet_partition(df, grouping, year, parquet_root=PARQUET_ROOT):
+    """Write one year of a report to its Parquet partition"""
+    path = os.path.join(parquet_root, grouping, f'year={year}', 'part-0.parquet')
+    return write_parquet_atomic(df, path)
+
+
+def write_report(df, grouping, year, parquet_root=PARQUET_ROOT):
+    """Write a report both as CSV and as a Parquet partition, returning both paths"""
+    csv_path = CSV_REPORTS[grouping].format(year=year)
+    write_csv_atomic(df, csv_path)
+    parquet_path = write_parquet_partition(df, grouping, year, parquet_root)
+    return csv_path, parquet_path
+
+
+def _apply_filters(df, filters):
+    """Apply (column, op, value) filters to a DataFrame read from CSV"""
+    for column, op, value in filters:
+        if op in ('=', '=='):
+            df = df[df[column] == value]
+        elif op == 'in':
+            df = df[df[column].isin(value)]
+        else:
+            raise ValueError(f"Unsupported filter operator for CSV input: {op}")
+    return df
+
+
+def read_report(grouping, year, columns=None, filters=None, parquet_root=PARQUET_ROOT):
+    """Read one year of a report, only loading the requested columns and matching rows
+
+    Reads the Parquet partition when it exists and falls back to the CSV report otherwise.
+    filters is a list of (column, op, value) tuples, e.g. [('fuel_type', '==', 'EL')].
+    """
+    partition_dir = os.path.join(parquet_root, grouping, f'year={year}')
+    # The directory can exist without its file if a run died before the rename
+    if os.path.isfile(os.path.join(partition_dir, 'part-0.parquet')):
+        return pd.read_parquet(partition_dir, columns=columns, filters=filters)
+
+    print(f"No Parquet output found in {partition_dir}, reading CSV instead...")
+    usecols = None
+    if columns is not None:
+        # Filter columns must be loaded too, then dropped again
+        usecols = list(dict.fromkeys(list(columns) + [f[0] for f in filters or []]))
+    df = pd.read_csv(CSV_REPORTS[grouping].format(year=year), usecols=usecols)
+    if filters:
+        df = _apply_filters(df, filters)
+    if columns is not None:
+        df = df[list(columns)]
+    return df.reset_index(drop=True)
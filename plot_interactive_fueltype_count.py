@@ -9,6 +9,7 @@ import branca.colormap as cm
 import json
 import pandas as pd
 import numpy as np
+from output_writer import read_report
 
 # Fuel type options:
 # CNG (CN) - Compressed Natural Gas
@@ -49,10 +50,10 @@ FUEL_TYPES = {
 
 # Read the fuel type data
 print(f"Reading vehicle count data for {FUEL_TYPES[FUEL_TYPE]} ({FUEL_TYPE})...")
-fuel_type_data = pd.read_csv('OUTPUT/yearly_mileage_by_fuel_type_2023.csv')
-
-# Filter data for selected fuel type
-type_data = fuel_type_data[fuel_type_data['fuel_type'] == FUEL_TYPE]
+# Only the selected fuel type and the columns used by the map are read
+type_data = read_report('fuel_type', 2023,
+                        columns=['postcode_area', 'fuel_type', 'vehicle_count'],
+                        filters=[('fuel_type', '==', FUEL_TYPE)])
 
 # Clean the data - remove any NaN or infinite values
 type_data = type_data.replace([np.inf, -np.inf], np.nan)
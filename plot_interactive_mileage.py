@@ -5,16 +5,18 @@ import branca.colormap as cm
 import json
 import pandas as pd
 import numpy as np
+from output_writer import read_report
 
 # Configuration - Change this value to show different vehicle types
 VEHICLE_TYPE = 7 # Options: 1, 2, 3, 4, etc.
 
 # Read the mileage data
 print(f"Reading average mileage data for vehicle type {VEHICLE_TYPE}...")
-vehicle_type_data = pd.read_csv('OUTPUT/yearly_mileage_by_vehicle_type_2023.csv')
-
-# Filter data for selected vehicle type
-type_data = vehicle_type_data[vehicle_type_data['vehicle_type'] == VEHICLE_TYPE]
+# Only the selected vehicle type and the columns used by the map are read
+type_data = read_report('vehicle_type', 2023,
+                        columns=['postcode_area', 'vehicle_type', 'average_yearly_mileage', 'vehicle_count',
+                                 'min_yearly_mileage', 'max_yearly_mileage', 'percentile_5', 'percentile_95'],
+                        filters=[('vehicle_type', '==', VEHICLE_TYPE)])
 
 # Clean the data - remove any NaN or infinite values
 type_data = type_data.replace([np.inf, -np.inf], np.nan)
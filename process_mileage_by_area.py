@@ -4,6 +4,9 @@ import numpy as np
 import time
 import psutil
 import os
+from mileage_history_index import MileageHistoryIndexBuilder
+from output_writer import write_report
+from monthly_rollups import MonthlyRollupBuilder
 
 def get_memory_usage():
     process = psutil.Process(os.getpid())
@@ -24,6 +27,12 @@ max_chunks = None  # For testing, set to None for full processing
 # Dictionary to store statistics by area and vehicle type
 area_mileage_stats = {}
 
+# Per-vehicle test history index, built as a byproduct of this pass
+history_index = MileageHistoryIndexBuilder(2023)
+
+# Monthly partial aggregates keyed on test_date, only this file's contribution is rewritten
+monthly_rollups = MonthlyRollupBuilder('test_result_2023')
+
 print("\nProcessing 2023 data...")
 start_time = time.time()
 total_rows = 0
@@ -64,6 +73,9 @@ for chunk in csv_reader:
     chunk['first_use_date'] = pd.to_datetime(chunk['first_use_date'], errors='coerce')
     chunk['test_date'] = pd.to_datetime(chunk['test_date'], errors='coerce')
     
+    # Add the raw rows to the vehicle history index before any filtering
+    history_index.add_chunk(chunk)
+    
     # Filter out rows with invalid dates
     chunk = chunk.dropna(subset=['first_use_date', 'test_date'])
     
@@ -79,6 +91,9 @@ for chunk in csv_reader:
     # Calculate yearly mileage
     chunk['yearly_mileage'] = chunk['test_mileage'] / chunk['vehicle_age']
     
+    # Update the monthly rollups
+    monthly_rollups.add_chunk(chunk)
+    
     # Update counters
     total_rows += len(chunk)
     vehicles_processed.update(chunk['vehicle_id'].unique())
@@ -138,6 +153,16 @@ for chunk in csv_reader:
     print(f"\rProcessing: {total_rows:,} rows, {len(vehicles_processed):,} vehicles, "
           f"{rows_per_second:.0f} rows/sec, {get_memory_usage():.1f}MB memory", end='')
 
+print()
+# A partial run would replace the full index and this file's full rollup contribution,
+# so only full runs update them
+if max_chunks is None:
+    history_index.finalize()
+    monthly_rollups.finalize()
+else:
+    history_index.discard()
+    print("Skipping history index and monthly rollup update because max_chunks is set")
+
 print(f"\n\nProcessed data: {total_rows:,} rows, {len(vehicles_processed):,} vehicles in {format_time(time.time() - start_time)}")
 
 # Calculate final statistics
@@ -220,18 +245,14 @@ if results_data:
     results_df = results_df.sort_values('average_yearly_mileage', ascending=False)
     vehicle_type_df = vehicle_type_df.sort_values(['postcode_area', 'average_yearly_mileage'], ascending=[True, False])
     
-    # Save results
-    output_file = 'OUTPUT/yearly_mileage_2023.csv'
-    vehicle_type_output_file = 'OUTPUT/yearly_mileage_by_vehicle_type_2023.csv'
-    fuel_type_output_file = 'OUTPUT/yearly_mileage_by_fuel_type_2023.csv'
-    
-    results_df.to_csv(output_file, index=False)
-    vehicle_type_df.to_csv(vehicle_type_output_file, index=False)
-    fuel_type_df.to_csv(fuel_type_output_file, index=False)
+    # Save results (CSV plus a year-partitioned Parquet dataset per grouping)
+    output_file, output_parquet = write_report(results_df, 'area', 2023)
+    vehicle_type_output_file, vehicle_type_output_parquet = write_report(vehicle_type_df, 'vehicle_type', 2023)
+    fuel_type_output_file, fuel_type_output_parquet = write_report(fuel_type_df, 'fuel_type', 2023)
 
-    print(f"\nResults saved to {output_file}")
-    print(f"Vehicle type statistics saved to {vehicle_type_output_file}")
-    print(f"Fuel type statistics saved to {fuel_type_output_file}")
+    print(f"\nResults saved to {output_file} and {output_parquet}")
+    print(f"Vehicle type statistics saved to {vehicle_type_output_file} and {vehicle_type_output_parquet}")
+    print(f"Fuel type statistics saved to {fuel_type_output_file} and {fuel_type_output_parquet}")
     
     # Print summary statistics
     print("\nProcessing complete!")